@@ -2,10 +2,11 @@ from flask import Flask, request, jsonify, send_from_directory
 import os
 import threading
 import time
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 from werkzeug.utils import secure_filename
 from pipeline import asr_transcribe, multimodal_reason, tts_synthesize
 from qwen_runtime import load_model_once
+import profiling
 
 # Configuration
 # Set IP based on network: phone hotspot -> 172.20.10.4, home Wi-Fi (4THU_6RZZNT) -> 192.168.55.114
@@ -15,6 +16,7 @@ BASE_URL = f"http://{IP}:5050"
 DATA_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "data"))
 FRAMES_DIR = os.path.join(DATA_DIR, "frames")
 AUDIOS_DIR = os.path.join(DATA_DIR, "audios")
+PROFILES_DIR = os.path.join(DATA_DIR, "profiles")
 STATIC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "static"))
 OUTPUTS_DIR = os.path.join(STATIC_DIR, "outputs")
 
@@ -23,9 +25,14 @@ MAX_SAMPLED_FRAMES = 3
 
 RETENTION_SECONDS = 30 * 60  # 30 minutes
 
+# Profiling: requests with header `X-Profile: 1` are always profiled; additionally
+# profile this fraction of traffic at random (0.0 disables sampling)
+PROFILE_SAMPLE_RATE = 0.0
+
 os.makedirs(FRAMES_DIR, exist_ok=True)
 os.makedirs(AUDIOS_DIR, exist_ok=True)
 os.makedirs(OUTPUTS_DIR, exist_ok=True)
+os.makedirs(PROFILES_DIR, exist_ok=True)
 
 app = Flask(__name__, static_folder=STATIC_DIR)
 
@@ -65,6 +72,28 @@ def evenly_sample(items: List[Tuple[int, str]], k: int) -> List[Tuple[int, str]]
     return sampled
 
 
+def maybe_begin_profile(name: str):
+    """Start a request profile if asked for via header or picked by sampling; else None."""
+    if not profiling.should_profile(request.headers.get(profiling.PROFILE_HEADER), PROFILE_SAMPLE_RATE):
+        return None
+    print(f"[{name}] profiling enabled")
+    return profiling.begin(name)
+
+
+def finish_profile(profile) -> Optional[Dict[str, str]]:
+    """Write profile artifacts and return their download URLs; None if writing failed."""
+    try:
+        artifacts = profiling.end(profile, PROFILES_DIR)
+    except Exception as e:
+        print(f"[{profile.name}] profile write failed: {e}")
+        return None
+    if not artifacts:
+        return None
+    urls = {kind: f"{BASE_URL}/profiles/{fname}" for kind, fname in artifacts.items()}
+    print(f"[{profile.name}] profile written -> {urls['summary']}")
+    return urls
+
+
 @app.route("/process_frame", methods=["POST"])
 def process_frame():
     print("[process_frame] request received")
@@ -146,16 +175,19 @@ def process_audio():
     print(f"[process_audio] sampled frames -> {len(selected_frames)}")
 
     # Pipeline
+    profile = maybe_begin_profile("process_audio")
     try:
         t_asr_start = time.time()
         print("[process_audio] ASR start")
-        transcript = asr_transcribe(audio_save_path)
+        with profiling.stage("asr"):
+            transcript = asr_transcribe(audio_save_path)
         t_asr = (time.time() - t_asr_start) * 1000
         print(f"[process_audio] ASR done in {t_asr:.1f} ms, text preview: {str(transcript)[:60]}")
 
         t_mm_start = time.time()
         print("[process_audio] Multimodal generation start")
-        output_text = multimodal_reason(transcript, selected_frames)
+        with profiling.stage("multimodal"):
+            output_text = multimodal_reason(transcript, selected_frames)
         t_mm = (time.time() - t_mm_start) * 1000
         print(f"[process_audio] Multimodal done in {t_mm:.1f} ms, text preview: {str(output_text)[:60]}")
 
@@ -163,17 +195,26 @@ def process_audio():
         out_mp3_path = os.path.join(OUTPUTS_DIR, f"{req_id}.mp3")
         t_tts_start = time.time()
         print("[process_audio] TTS start")
-        tts_synthesize(output_text, out_mp3_path)
+        with profiling.stage("tts"):
+            tts_synthesize(output_text, out_mp3_path)
         t_tts = (time.time() - t_tts_start) * 1000
         print(f"[process_audio] TTS done in {t_tts:.1f} ms -> {out_mp3_path}")
 
         audio_url = f"{BASE_URL}/static/outputs/{req_id}.mp3"
         t_total = (time.time() - t_total_start) * 1000
         print(f"[process_audio] returning audio_url -> {audio_url}; total {t_total:.1f} ms")
-        return jsonify({"audio_url": audio_url, "text": output_text, "timings_ms": {"asr": t_asr, "multimodal": t_mm, "tts": t_tts, "total": t_total}})
+        result = {"audio_url": audio_url, "text": output_text, "timings_ms": {"asr": t_asr, "multimodal": t_mm, "tts": t_tts, "total": t_total}}
+        status = 200
     except Exception as e:
         print(f"[process_audio] error: {e}")
-        return jsonify({"error": str(e)}), 500
+        result = {"error": str(e)}
+        status = 500
+
+    if profile is not None:
+        profile_urls = finish_profile(profile)
+        if profile_urls:
+            result["profile"] = profile_urls
+    return jsonify(result), status
 
 
 @app.route("/process", methods=["POST"])
@@ -221,16 +262,19 @@ def process_single_audio_image():
     selected_frames: List[Tuple[int, str]] = [(ts_for_frame, image_save_path)]
 
     # Pipeline
+    profile = maybe_begin_profile("process")
     try:
         t_asr_start = time.time()
         print("[process] ASR start")
-        transcript = asr_transcribe(audio_save_path)
+        with profiling.stage("asr"):
+            transcript = asr_transcribe(audio_save_path)
         t_asr = (time.time() - t_asr_start) * 1000
         print(f"[process] ASR done in {t_asr:.1f} ms, text preview: {str(transcript)[:60]}")
 
         t_mm_start = time.time()
         print("[process] Multimodal generation start")
-        output_text = multimodal_reason(transcript, selected_frames)
+        with profiling.stage("multimodal"):
+            output_text = multimodal_reason(transcript, selected_frames)
         t_mm = (time.time() - t_mm_start) * 1000
         print(f"[process] Multimodal done in {t_mm:.1f} ms, text preview: {str(output_text)[:60]}")
 
@@ -238,17 +282,26 @@ def process_single_audio_image():
         out_mp3_path = os.path.join(OUTPUTS_DIR, f"{req_id}.mp3")
         t_tts_start = time.time()
         print("[process] TTS start")
-        tts_synthesize(output_text, out_mp3_path)
+        with profiling.stage("tts"):
+            tts_synthesize(output_text, out_mp3_path)
         t_tts = (time.time() - t_tts_start) * 1000
         print(f"[process] TTS done in {t_tts:.1f} ms -> {out_mp3_path}")
 
         audio_url = f"{BASE_URL}/static/outputs/{req_id}.mp3"
         t_total = (time.time() - t_total_start) * 1000
         print(f"[process] returning audio_url -> {audio_url}; total {t_total:.1f} ms")
-        return jsonify({"audio_url": audio_url, "text": output_text, "timings_ms": {"asr": t_asr, "multimodal": t_mm, "tts": t_tts, "total": t_total}})
+        result = {"audio_url": audio_url, "text": output_text, "timings_ms": {"asr": t_asr, "multimodal": t_mm, "tts": t_tts, "total": t_total}}
+        status = 200
     except Exception as e:
         print(f"[process] error: {e}")
-        return jsonify({"error": str(e)}), 500
+        result = {"error": str(e)}
+        status = 500
+
+    if profile is not None:
+        profile_urls = finish_profile(profile)
+        if profile_urls:
+            result["profile"] = profile_urls
+    return jsonify(result), status
 
 
 @app.route('/static/outputs/<path:filename>', methods=['GET'])
@@ -256,6 +309,11 @@ def serve_output(filename: str):
     return send_from_directory(OUTPUTS_DIR, filename, as_attachment=False)
 
 
+@app.route('/profiles/<path:filename>', methods=['GET'])
+def serve_profile(filename: str):
+    return send_from_directory(PROFILES_DIR, filename, as_attachment=True)
+
+
 # Background cleanup
 
 def _delete_older_than(dir_path: str, cutoff_epoch_s: float):
@@ -280,6 +338,7 @@ def cleanup_loop():
         _delete_older_than(FRAMES_DIR, cutoff)
         _delete_older_than(AUDIOS_DIR, cutoff)
         _delete_older_than(OUTPUTS_DIR, cutoff)
+        _delete_older_than(PROFILES_DIR, cutoff)
 
         # Prune frames_index entries not on disk or too old
         with frames_index_lock:
@@ -15,6 +15,11 @@ SAMPLE_MP3 = os.path.abspath(os.path.join(os.path.dirname(__file__), "static", "
 # ASR_OVERRIDE_AUDIO_PATH: Optional[str] = None
 ASR_OVERRIDE_AUDIO_PATH = "/Users/ritine/Imperial/Indivisual_Project/server/static/test.mp3"
 
+# Early-exit decoding for the spoken answer (None disables each control)
+MM_MAX_SENTENCES: Optional[int] = None  # stop after this many complete sentences
+MM_DEADLINE_S: Optional[float] = None  # stop decoding this many seconds after the model is ready (first-call load not counted)
+MM_TARGET_SPEECH_S: Optional[float] = None  # cap tokens at roughly this much TTS speech
+
 
 def _convert_to_wav_16k_mono(src_path: str) -> str:
     """Convert input audio to 16kHz mono WAV using ffmpeg. Returns path to temp wav."""
@@ -106,7 +111,13 @@ def prepare_qwen_vl_inputs(transcript_text: str, frames: List[Tuple[int, str]],
 def multimodal_reason(transcript_text: str, frames: List[Tuple[int, str]]) -> str:
     messages = prepare_qwen_vl_inputs(transcript_text, frames)
     try:
-        return generate(messages, max_new_tokens=64)
+        return generate(
+            messages,
+            max_new_tokens=64,
+            max_sentences=MM_MAX_SENTENCES,
+            deadline_s=MM_DEADLINE_S,
+            target_speech_s=MM_TARGET_SPEECH_S,
+        )
     except Exception:
         if not frames:
             return f"You said: {transcript_text}. No frames captured."
@@ -0,0 +1,160 @@
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from typing import Any, Dict, List, Optional
+
+# Request header that turns profiling on for a single request ("1", "true", "yes", "on")
+PROFILE_HEADER = "X-Profile"
+# Interval between stack samples of the profiled thread
+SAMPLE_INTERVAL_S = 0.005
+
+# Per-thread active profile; None (the common case) makes every hook a no-op
+_LOCAL = threading.local()
+_NULL_STAGE = nullcontext()
+
+
+def should_profile(header_value: Optional[str], sample_rate: float = 0.0) -> bool:
+    """Decide whether a request is profiled: explicit header opt-in, else random sampling."""
+    if header_value and header_value.strip().lower() in {"1", "true", "yes", "on"}:
+        return True
+    return sample_rate > 0 and random.random() < sample_rate
+
+
+class _StackSampler(threading.Thread):
+    """Periodically samples the target thread's Python stack into collapsed-stack counts."""
+
+    def __init__(self, target_ident: int, interval_s: float):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.target_ident = target_ident
+        self.interval_s = interval_s
+        self.stacks: Counter = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval_s):
+            frame = sys._current_frames().get(self.target_ident)
+            if frame is None:
+                continue
+            labels = []
+            while frame is not None:
+                code = frame.f_code
+                labels.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(labels))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class RequestProfile:
+    """Profile of one request: sampled stacks, named stage timings and decode step timings."""
+
+    def __init__(self, name: str, interval_s: float = SAMPLE_INTERVAL_S):
+        self.profile_id = f"{int(time.time() * 1000)}_{uuid.uuid4().hex[:8]}"
+        self.name = name
+        self.interval_s = interval_s
+        self.stages: List[Dict[str, Any]] = []
+        self.decode_steps_ms: List[float] = []
+        self.artifacts: Optional[Dict[str, str]] = None
+        self._t_start = time.perf_counter()
+        self._t_end: Optional[float] = None
+        self._sampler = _StackSampler(threading.get_ident(), interval_s)
+        self._sampler.start()
+
+    @contextmanager
+    def stage(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_stage(name, (time.perf_counter() - t0) * 1000, start=t0)
+
+    def record_stage(self, name: str, ms: float, start: Optional[float] = None) -> None:
+        if start is None:
+            start = time.perf_counter() - ms / 1000
+        self.stages.append({"name": name, "start_ms": (start - self._t_start) * 1000, "ms": ms})
+
+    def record_decode_step(self, ms: float) -> None:
+        self.decode_steps_ms.append(ms)
+
+    def summary(self) -> Dict[str, Any]:
+        end = self._t_end if self._t_end is not None else time.perf_counter()
+        totals: Dict[str, float] = {}
+        for s in self.stages:
+            totals[s["name"]] = totals.get(s["name"], 0.0) + s["ms"]
+        steps = sorted(self.decode_steps_ms)
+        decode: Dict[str, Any] = {"tokens": len(steps), "total_ms": sum(steps)}
+        if steps:
+            decode.update({
+                "mean_ms": sum(steps) / len(steps),
+                "p50_ms": steps[len(steps) // 2],
+                "p90_ms": steps[min(len(steps) - 1, int(len(steps) * 0.9))],
+                "max_ms": steps[-1],
+            })
+        return {
+            "profile_id": self.profile_id,
+            "name": self.name,
+            "total_ms": (end - self._t_start) * 1000,
+            "sample_interval_ms": self.interval_s * 1000,
+            "samples": sum(self._sampler.stacks.values()),
+            "stage_totals_ms": totals,
+            "stages": self.stages,
+            "decode": decode,
+            "decode_steps_ms": self.decode_steps_ms,
+        }
+
+    def collapsed(self) -> str:
+        """Sampled stacks in collapsed format ("frame;frame;frame count"), flamegraph-ready."""
+        return "".join(f"{stack} {count}\n" for stack, count in self._sampler.stacks.most_common())
+
+
+def begin(name: str, interval_s: float = SAMPLE_INTERVAL_S) -> RequestProfile:
+    """Start profiling the calling thread and make the profile visible to `current()`/`stage()`."""
+    profile = RequestProfile(name, interval_s)
+    _LOCAL.profile = profile
+    return profile
+
+
+def end(profile: RequestProfile, out_dir: str) -> Dict[str, str]:
+    """Stop sampling and write `<id>.collapsed` and `<id>.json` to out_dir. Safe to call twice.
+
+    Returns the artifact filenames keyed by kind ("collapsed", "summary"). If writing fails
+    the error propagates once; later calls return an empty dict instead of retrying.
+    """
+    if profile.artifacts is not None:
+        return profile.artifacts
+    profile._sampler.stop()
+    profile._t_end = time.perf_counter()
+    profile.artifacts = {}
+    if getattr(_LOCAL, "profile", None) is profile:
+        _LOCAL.profile = None
+
+    os.makedirs(out_dir, exist_ok=True)
+    collapsed_name = f"{profile.profile_id}.collapsed"
+    summary_name = f"{profile.profile_id}.json"
+    with open(os.path.join(out_dir, collapsed_name), "w") as f:
+        f.write(profile.collapsed())
+    with open(os.path.join(out_dir, summary_name), "w") as f:
+        json.dump(profile.summary(), f, indent=2)
+    profile.artifacts = {"collapsed": collapsed_name, "summary": summary_name}
+    return profile.artifacts
+
+
+def current() -> Optional[RequestProfile]:
+    """Active profile of the calling thread, or None when profiling is off."""
+    return getattr(_LOCAL, "profile", None)
+
+
+def stage(name: str):
+    """Context manager timing a named stage; a shared no-op when profiling is off."""
+    profile = getattr(_LOCAL, "profile", None)
+    if profile is None:
+        return _NULL_STAGE
+    return profile.stage(name)
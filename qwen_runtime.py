@@ -1,7 +1,12 @@
 import threading
 import os
+import re
+import math
+import time
 from typing import List, Dict, Any, Optional
 
+import profiling
+
 # Global singleton holder
 _MODEL_LOCK = threading.Lock()
 _MODEL = None  # type: Optional[object]
@@ -18,6 +23,17 @@ _RUNTIME_CFG = {
     "max_pixels": 1280 * 28 * 28,
 }
 
+# Speech-duration -> token budget conversion for `target_speech_s` (gTTS speaks ~150 wpm)
+SPEECH_WORDS_PER_S = 2.5
+TOKENS_PER_WORD = 1.3
+
+# A sentence ends at terminal punctuation (plus closing quotes/brackets) followed by
+# whitespace; full-width CJK terminators end a sentence immediately. Group 1 is the word
+# before the terminator, used to skip list numbers and abbreviations.
+_SENTENCE_END = re.compile(r"(\w*)([.!?]+)[\"'”’)\]]*\s+|[。！？]+")
+# Words whose trailing period does not end a sentence (single letters are skipped too: "e.g.", "J.")
+_ABBREVIATIONS = {"mr", "mrs", "ms", "dr", "st", "jr", "sr", "prof", "vs", "fig", "approx"}
+
 
 def load_model_once(**overrides) -> None:
     """Lazily initialize the model once per process.
@@ -61,8 +77,229 @@ def load_model_once(**overrides) -> None:
             raise
 
 
-def generate(messages: List[Dict[str, Any]], max_new_tokens: int = 256, **gen_kwargs) -> str:
-    """Run inference with Qwen-2.5-VL-3B on provided messages."""
+def _with_decode_timer(stopping_criteria, profile):
+    """Append a never-stopping criterion that times the first token and each decode step.
+
+    HF generate evaluates stopping criteria once per generated token. The clock starts
+    just before _MODEL.generate is called, so the first interval ("prefill_first_token")
+    is time-to-first-token: generate setup (logits processors, cache allocation), the
+    prefill forward pass and sampling the first token. Each later call marks the end of
+    one decode step.
+    """
+    import torch
+    from transformers import StoppingCriteria, StoppingCriteriaList
+
+    class _DecodeTimer(StoppingCriteria):
+        def __init__(self):
+            self.t_last = time.perf_counter()
+            self.steps = 0
+
+        def __call__(self, input_ids, scores, **kwargs):
+            now = time.perf_counter()
+            if self.steps == 0:
+                profile.record_stage("prefill_first_token", (now - self.t_last) * 1000, start=self.t_last)
+            else:
+                profile.record_decode_step((now - self.t_last) * 1000)
+            self.t_last = now
+            self.steps += 1
+            return torch.zeros(input_ids.shape[0], dtype=torch.bool, device=input_ids.device)
+
+    criteria = StoppingCriteriaList(stopping_criteria or [])
+    criteria.append(_DecodeTimer())
+    return criteria
+
+
+def speech_token_budget(target_speech_s: float) -> int:
+    """Approximate number of new tokens that TTS reads aloud in target_speech_s seconds."""
+    return max(1, math.ceil(target_speech_s * SPEECH_WORDS_PER_S * TOKENS_PER_WORD))
+
+
+def _is_list_marker(text: str, word_start: int) -> bool:
+    """True when the number at word_start opens its sentence: start of text, of a line, or after a terminator."""
+    before = text[:word_start].rstrip(" \t")
+    return not before or before[-1] in "\n.!?。！？"
+
+
+def _sentence_ends(text: str, pos: int = 0):
+    """Yield (end, is_sentence) for each settled terminator in text[pos:].
+
+    A period does not end a sentence after a list marker ("1. " opening a line or
+    sentence), a single letter ("e.g. ") or a known abbreviation ("Mr. "); numbers
+    inside a sentence ("room 101. ") do end it.
+    """
+    for m in _SENTENCE_END.finditer(text, pos):
+        word, terminator = m.group(1), m.group(2)
+        is_sentence = True
+        if terminator is not None and terminator.startswith("."):
+            if word.isdigit():
+                is_sentence = not _is_list_marker(text, m.start(1))
+            else:
+                is_sentence = len(word) > 1 and word.lower() not in _ABBREVIATIONS
+        yield m.end(), is_sentence
+
+
+def _check_max_sentences(max_sentences: Optional[int]) -> None:
+    if max_sentences is not None and max_sentences < 1:
+        raise ValueError(f"max_sentences must be >= 1, got {max_sentences}")
+
+
+def truncate_sentences(text: str, max_sentences: int) -> str:
+    """Keep only the first max_sentences complete sentences of text (unchanged if fewer)."""
+    _check_max_sentences(max_sentences)
+    count = 0
+    for end, is_sentence in _sentence_ends(text):
+        if is_sentence:
+            count += 1
+            if count == max_sentences:
+                return text[:end].rstrip()
+    return text
+
+
+class IncrementalDetokenizer:
+    """Detokenize a growing token sequence, decoding only a small trailing window per token.
+
+    Keeps a prefix/read offset pair so that multi-token characters and word-boundary
+    spaces come out right; text is emitted once it no longer ends in a partial character.
+    """
+
+    def __init__(self, tokenizer, skip_special_tokens: bool = True):
+        self.tokenizer = tokenizer
+        self.skip_special_tokens = skip_special_tokens
+        self.tokens: List[int] = []
+        self.text = ""
+        self._prefix_offset = 0
+        self._read_offset = 0
+
+    def push(self, token_id: int) -> str:
+        """Append one token and return the newly completed text (may be empty)."""
+        self.tokens.append(token_id)
+        prefix_text = self.tokenizer.decode(
+            self.tokens[self._prefix_offset:self._read_offset], skip_special_tokens=self.skip_special_tokens
+        )
+        new_text = self.tokenizer.decode(
+            self.tokens[self._prefix_offset:], skip_special_tokens=self.skip_special_tokens
+        )
+        if len(new_text) > len(prefix_text) and not new_text.endswith("\ufffd"):
+            delta = new_text[len(prefix_text):]
+            self._prefix_offset = self._read_offset
+            self._read_offset = len(self.tokens)
+            self.text += delta
+            return delta
+        return ""
+
+
+class DecodeControls:
+    """Per-step early-exit checks on sentence count and a wall-clock deadline.
+
+    deadline is an absolute time.monotonic() value. Sentences are counted on incrementally
+    detokenized text, one detokenizer per batch row; a sentence is only known to be complete
+    once the token after its terminator arrives, so stopping costs one extra decode step.
+    """
+
+    def __init__(self, tokenizer, max_sentences: Optional[int] = None, deadline: Optional[float] = None):
+        _check_max_sentences(max_sentences)
+        self.tokenizer = tokenizer
+        self.max_sentences = max_sentences
+        self.deadline = deadline
+        self.steps = 0
+        self.stop_reason: Optional[str] = None
+        self.detokenizers: List[IncrementalDetokenizer] = []
+        self._sentences: List[int] = []
+        self._scan_pos: List[int] = []
+
+    def step(self, last_tokens: List[int]) -> List[bool]:
+        """Feed the newest token of each batch row; return which rows should stop."""
+        batch = len(last_tokens)
+        if not self.detokenizers:
+            self.detokenizers = [IncrementalDetokenizer(self.tokenizer) for _ in range(batch)]
+            self._sentences = [0] * batch
+            self._scan_pos = [0] * batch
+        self.steps += 1
+        done = [False] * batch
+        if self.max_sentences is not None:
+            for row in range(batch):
+                detok = self.detokenizers[row]
+                if detok.push(last_tokens[row]):
+                    for end, is_sentence in _sentence_ends(detok.text, self._scan_pos[row]):
+                        if is_sentence:
+                            self._sentences[row] += 1
+                        self._scan_pos[row] = end
+                done[row] = self._sentences[row] >= self.max_sentences
+            if all(done):
+                self.stop_reason = "sentences"
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            done = [True] * batch
+            self.stop_reason = self.stop_reason or "deadline"
+        return done
+
+
+def build_decode_controls(controls: DecodeControls):
+    """Wrap DecodeControls into a StoppingCriteria for HF generate."""
+    import torch
+    from transformers import StoppingCriteria
+
+    class _DecodeControlsCriteria(StoppingCriteria):
+        def __call__(self, input_ids, scores, **kwargs):
+            done = controls.step(input_ids[:, -1].tolist())
+            return torch.tensor(done, dtype=torch.bool, device=input_ids.device)
+
+    return _DecodeControlsCriteria()
+
+
+def prepare_decode_controls(
+    tokenizer,
+    max_new_tokens: int,
+    gen_kwargs: Dict[str, Any],
+    max_sentences: Optional[int] = None,
+    deadline_s: Optional[float] = None,
+    target_speech_s: Optional[float] = None,
+    t_start: Optional[float] = None,
+):
+    """Apply the early-exit options to HF generate arguments.
+
+    deadline_s counts from t_start (time.monotonic(), default now). Returns
+    (max_new_tokens, gen_kwargs, controls); gen_kwargs is a copy whose stopping_criteria
+    keeps the caller's criteria, and controls is None when no per-step check is needed.
+    """
+    _check_max_sentences(max_sentences)
+    if target_speech_s is not None:
+        max_new_tokens = min(max_new_tokens, speech_token_budget(target_speech_s))
+    gen_kwargs = dict(gen_kwargs)
+    controls = None
+    if max_sentences is not None or deadline_s is not None:
+        from transformers import StoppingCriteriaList
+
+        if t_start is None:
+            t_start = time.monotonic()
+        controls = DecodeControls(
+            tokenizer,
+            max_sentences=max_sentences,
+            deadline=t_start + deadline_s if deadline_s is not None else None,
+        )
+        criteria = StoppingCriteriaList(gen_kwargs.get("stopping_criteria") or [])
+        criteria.append(build_decode_controls(controls))
+        gen_kwargs["stopping_criteria"] = criteria
+    return max_new_tokens, gen_kwargs, controls
+
+
+def generate(
+    messages: List[Dict[str, Any]],
+    max_new_tokens: int = 256,
+    max_sentences: Optional[int] = None,
+    deadline_s: Optional[float] = None,
+    target_speech_s: Optional[float] = None,
+    **gen_kwargs,
+) -> str:
+    """Run inference with Qwen-2.5-VL-3B on provided messages.
+
+    Optional early-exit controls:
+    - max_sentences: stop once this many complete sentences (>= 1) were generated (output trimmed to them)
+    - deadline_s: stop decoding once this many seconds have passed since the model was ready; the
+      budget covers chat templating, image loading, tensorization and decoding, but not a
+      first-call model load
+    - target_speech_s: cap new tokens at roughly what TTS speaks in this many seconds
+    """
+    _check_max_sentences(max_sentences)
     if _MODEL is None or _PROCESSOR is None:
         try:
             load_model_once()
@@ -91,33 +328,58 @@ def generate(messages: List[Dict[str, Any]], max_new_tokens: int = 256, **gen_kw
         transcript_preview = " ".join(text_segments)[:80]
         return f"[Qwen-Stub] images={image_count}; prompt=\"{transcript_preview}...\""
 
+    t_start = time.monotonic()
     try:
         from qwen_vl_utils import process_vision_info
 
-        text = _PROCESSOR.apply_chat_template(
-            messages, tokenize=False, add_generation_prompt=True
-        )
-        image_inputs, video_inputs = process_vision_info(messages)
-        inputs = _PROCESSOR(
-            text=[text],
-            images=image_inputs,
-            videos=video_inputs,
-            padding=True,
-            return_tensors="pt",
-        )
-        device = next(_MODEL.parameters()).device
-        inputs = inputs.to(device)
-        generated_ids = _MODEL.generate(
-            **inputs,
-            max_new_tokens=max_new_tokens,
-            **gen_kwargs,
+        with profiling.stage("apply_chat_template"):
+            text = _PROCESSOR.apply_chat_template(
+                messages, tokenize=False, add_generation_prompt=True
+            )
+        with profiling.stage("process_vision_info"):
+            image_inputs, video_inputs = process_vision_info(messages)
+        with profiling.stage("processor"):
+            inputs = _PROCESSOR(
+                text=[text],
+                images=image_inputs,
+                videos=video_inputs,
+                padding=True,
+                return_tensors="pt",
+            )
+        with profiling.stage("to_device"):
+            device = next(_MODEL.parameters()).device
+            inputs = inputs.to(device)
+
+        max_new_tokens, gen_kwargs, controls = prepare_decode_controls(
+            _PROCESSOR.tokenizer,
+            max_new_tokens,
+            gen_kwargs,
+            max_sentences=max_sentences,
+            deadline_s=deadline_s,
+            target_speech_s=target_speech_s,
+            t_start=t_start,
         )
+
+        profile = profiling.current()
+        if profile is not None:
+            gen_kwargs["stopping_criteria"] = _with_decode_timer(gen_kwargs.get("stopping_criteria"), profile)
+        with profiling.stage("generate"):
+            generated_ids = _MODEL.generate(
+                **inputs,
+                max_new_tokens=max_new_tokens,
+                **gen_kwargs,
+            )
         generated_ids_trimmed = [
             out_ids[len(in_ids):] for in_ids, out_ids in zip(inputs.input_ids, generated_ids)
         ]
-        output_text = _PROCESSOR.batch_decode(
-            generated_ids_trimmed, skip_special_tokens=True, clean_up_tokenization_spaces=False
-        )
+        if controls is not None and controls.stop_reason:
+            print(f"[generate] early exit ({controls.stop_reason}) after {controls.steps} tokens")
+        with profiling.stage("batch_decode"):
+            output_text = _PROCESSOR.batch_decode(
+                generated_ids_trimmed, skip_special_tokens=True, clean_up_tokenization_spaces=False
+            )
+        if output_text and max_sentences is not None:
+            output_text = [truncate_sentences(t, max_sentences) for t in output_text]
         return output_text[0] if output_text else "No output generated"
 
     except Exception as e:
@@ -0,0 +1,160 @@
+import argparse
+import statistics
+import time
+from typing import List
+
+from qwen_runtime import prepare_decode_controls, truncate_sentences
+
+# Benchmark decode steps and latency saved by the early-exit controls of qwen_runtime.generate.
+# Generation goes through the same prepare_decode_controls/truncate_sentences wiring as
+# generate(); only Qwen-VL chat templating and image preprocessing are left out.
+#
+# # Tiny random Qwen2 model with a small offline word-level tokenizer (default)
+# PYTHONPATH=. python test/bench_decode.py
+#
+# # Real tokenizer / text model
+# PYTHONPATH=. python test/bench_decode.py --model Qwen/Qwen2.5-0.5B-Instruct --tokenizer Qwen/Qwen2.5-0.5B-Instruct
+
+PROMPTS = [
+    "What is on the table in front of me?\n\nPlease answer concisely in English, using the images as context.",
+    "Read the sign on the door.\n\nPlease answer concisely in English, using the images as context.",
+    "How many people are in the room?\n\nPlease answer concisely in English, using the images as context.",
+    "What color is the car outside?\n\nPlease answer concisely in English, using the images as context.",
+    "Describe what I am looking at.\n\nPlease answer concisely in English, using the images as context.",
+]
+
+
+# Small vocabulary so that a random model hits sentence ends about as often as real text does
+TINY_WORDS = (
+    "the it is on in of and this there are red blue mug cup table door sign room car people "
+    "window chair left right front two small open"
+).split()
+
+
+def build_tiny_tokenizer():
+    """Offline word-level tokenizer: words with a leading space marker, plus punctuation."""
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers
+    from transformers import PreTrainedTokenizerFast
+
+    vocab = {"<unk>": 0, "<eos>": 1}
+    for piece in [".", "!", "?", ","] + ["\u2581" + w for w in TINY_WORDS]:
+        vocab.setdefault(piece, len(vocab))
+    tok = Tokenizer(models.WordLevel(vocab, unk_token="<unk>"))
+    tok.pre_tokenizer = pre_tokenizers.Sequence([pre_tokenizers.Metaspace(), pre_tokenizers.Punctuation()])
+    tok.decoder = decoders.Metaspace()
+    tokenizer = PreTrainedTokenizerFast(tokenizer_object=tok, unk_token="<unk>", eos_token="<eos>")
+    tokenizer.chat_template = "{% for m in messages %}{{ m['content'] }} {% endfor %}"
+    return tokenizer
+
+
+def build_tiny_random_model(vocab_size: int, seed: int):
+    import torch
+    from transformers import Qwen2Config, Qwen2ForCausalLM
+
+    torch.manual_seed(seed)
+    config = Qwen2Config(
+        vocab_size=vocab_size,
+        hidden_size=64,
+        intermediate_size=128,
+        num_hidden_layers=2,
+        num_attention_heads=4,
+        num_key_value_heads=2,
+        max_position_embeddings=1024,
+    )
+    return Qwen2ForCausalLM(config).eval()
+
+
+def encode_prompts(tokenizer) -> List:
+    encoded = []
+    for prompt in PROMPTS:
+        messages = [
+            {"role": "system", "content": "You are a helpful multimodal assistant."},
+            {"role": "user", "content": prompt},
+        ]
+        text = tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+        encoded.append(tokenizer(text, return_tensors="pt"))
+    return encoded
+
+
+def run_mode(model, tokenizer, inputs, max_new_tokens: int, seed: int, **controls_kwargs):
+    """Generate every prompt once; return (decode steps, latency ms, spoken words) per prompt.
+
+    Sampling is reseeded per prompt so every mode sees the same token sequence and only
+    the stopping point differs.
+    """
+    import torch
+
+    steps, latencies, words = [], [], []
+    for enc in inputs:
+        torch.manual_seed(seed)
+        t0 = time.monotonic()
+        max_new, gen_kwargs, _ = prepare_decode_controls(
+            tokenizer,
+            max_new_tokens,
+            {"do_sample": True, "pad_token_id": tokenizer.pad_token_id or tokenizer.eos_token_id},
+            t_start=t0,
+            **controls_kwargs,
+        )
+        out = model.generate(**enc, max_new_tokens=max_new, **gen_kwargs)
+        text = tokenizer.decode(out[0, enc.input_ids.shape[1]:], skip_special_tokens=True)
+        if controls_kwargs.get("max_sentences") is not None:
+            text = truncate_sentences(text, controls_kwargs["max_sentences"])
+        latencies.append((time.monotonic() - t0) * 1000)
+        steps.append(out.shape[1] - enc.input_ids.shape[1])
+        words.append(len(text.split()))
+    return steps, latencies, words
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark early-exit decoding controls")
+    parser.add_argument("--tokenizer", default=None, help="HF tokenizer; default: tiny offline word-level tokenizer")
+    parser.add_argument("--model", default=None, help="Causal LM to load; default: tiny random Qwen2")
+    parser.add_argument("--max_new_tokens", type=int, default=64)
+    parser.add_argument("--max_sentences", type=int, default=2)
+    parser.add_argument("--deadline_ms", type=float, default=50.0)
+    parser.add_argument("--target_speech_s", type=float, default=8.0)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    from transformers import AutoTokenizer, AutoModelForCausalLM
+
+    tokenizer = AutoTokenizer.from_pretrained(args.tokenizer) if args.tokenizer else build_tiny_tokenizer()
+    if args.model:
+        model = AutoModelForCausalLM.from_pretrained(args.model, torch_dtype="auto").eval()
+    else:
+        model = build_tiny_random_model(len(tokenizer), args.seed)
+    inputs = encode_prompts(tokenizer)
+
+    modes = [
+        ("baseline", {}),
+        (f"sentences={args.max_sentences}", dict(max_sentences=args.max_sentences)),
+        (f"deadline={args.deadline_ms:.0f}ms", dict(deadline_s=args.deadline_ms / 1000)),
+        (f"speech={args.target_speech_s:.0f}s", dict(target_speech_s=args.target_speech_s)),
+    ]
+
+    # Warm up kernels/allocator so the first mode is not penalized
+    run_mode(model, tokenizer, inputs[:1], max_new_tokens=4, seed=args.seed)
+
+    results = {}
+    for name, kwargs in modes:
+        steps, latencies, words = [], [], []
+        for _ in range(args.repeats):
+            s, l, w = run_mode(model, tokenizer, inputs, args.max_new_tokens, args.seed, **kwargs)
+            steps.extend(s)
+            latencies.extend(l)
+            words.extend(w)
+        results[name] = (statistics.mean(steps), statistics.median(latencies), statistics.mean(words))
+
+    base_steps, base_ms, _ = results["baseline"]
+    print(f"=== Decode early-exit benchmark ({len(PROMPTS)} prompts x {args.repeats}) ===")
+    print(f"{'mode':<18}{'steps':>8}{'saved':>8}{'p50 ms':>10}{'saved ms':>10}{'words':>8}")
+    for name, (mean_steps, p50_ms, mean_words) in results.items():
+        print(
+            f"{name:<18}{mean_steps:>8.1f}{base_steps - mean_steps:>8.1f}"
+            f"{p50_ms:>10.1f}{base_ms - p50_ms:>10.1f}{mean_words:>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
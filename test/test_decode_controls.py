@@ -0,0 +1,130 @@
+import time
+
+import pytest
+
+from qwen_runtime import (
+    DecodeControls,
+    IncrementalDetokenizer,
+    prepare_decode_controls,
+    speech_token_budget,
+    truncate_sentences,
+)
+
+# Checks for the early-exit decoding helpers with stub tokenizers (no model needed)
+# python -m pytest -q test/test_decode_controls.py
+
+
+class ByteTokenizer:
+    """One token per UTF-8 byte, so multi-byte characters span several tokens."""
+
+    def encode(self, text):
+        return list(text.encode("utf-8"))
+
+    def decode(self, ids, skip_special_tokens=True):
+        return bytes(ids).decode("utf-8", errors="replace")
+
+
+class PieceTokenizer:
+    """Fixed vocabulary of text pieces; a token id indexes into the piece list."""
+
+    def __init__(self, pieces):
+        self.pieces = list(pieces)
+
+    def decode(self, ids, skip_special_tokens=True):
+        return "".join(self.pieces[i] for i in ids)
+
+
+def run_controls(controls, token_ids):
+    """Feed tokens one by one; return the step (1-based) that stopped, or None."""
+    for i, token_id in enumerate(token_ids, start=1):
+        if controls.step([token_id])[0]:
+            return i
+    return None
+
+
+def test_detokenizer_handles_multibyte_characters():
+    tok = ByteTokenizer()
+    detok = IncrementalDetokenizer(tok)
+    text = "Café 红色。Done."
+    for token_id in tok.encode(text):
+        detok.push(token_id)
+        assert "�" not in detok.text
+    assert detok.text == text
+
+
+def test_sentences_counted_across_token_boundaries():
+    pieces = ["It", " is", " re", "d", ".", " The", " mug", "!", " Bye", "."]
+    controls = DecodeControls(PieceTokenizer(pieces), max_sentences=2)
+    # Second sentence ends at "!" and is settled by the whitespace of " Bye"
+    assert run_controls(controls, range(len(pieces))) == 9
+    assert controls.stop_reason == "sentences"
+
+
+def test_terminator_counted_only_after_whitespace():
+    pieces = ["Red", ".", " It"]
+    controls = DecodeControls(PieceTokenizer(pieces), max_sentences=1)
+    assert controls.step([0]) == [False]
+    assert controls.step([1]) == [False]
+    assert controls.step([2]) == [True]
+
+
+def test_cjk_terminator_ends_sentence_immediately():
+    tok = ByteTokenizer()
+    controls = DecodeControls(tok, max_sentences=1)
+    ids = tok.encode("红色的杯子。")
+    assert run_controls(controls, ids) == len(ids)
+
+
+def test_numbers_and_abbreviations_do_not_end_sentences():
+    tok = ByteTokenizer()
+    for text in ["1. A red mug", "Mugs:\n2. A blue cup", "Mr. Smith is here", "e.g. a cup", "St. Paul"]:
+        controls = DecodeControls(tok, max_sentences=1)
+        assert run_controls(controls, tok.encode(text)) is None, text
+    assert truncate_sentences("1. A red mug. 2. A blue cup.", 1) == "1. A red mug."
+    assert truncate_sentences("1. A red mug. 2. A blue cup.", 2) == "1. A red mug. 2. A blue cup."
+
+
+def test_numbers_inside_a_sentence_end_it():
+    tok = ByteTokenizer()
+    for text in ["The room number is 101. Next", "I see 2. More"]:
+        controls = DecodeControls(tok, max_sentences=1)
+        assert run_controls(controls, tok.encode(text)) == text.index(". ") + 2, text
+    assert truncate_sentences("The room number is 101. It is open. ", 1) == "The room number is 101."
+    assert truncate_sentences("It costs $5. Yes. ", 1) == "It costs $5."
+    assert truncate_sentences("I see 2. And more. ", 1) == "I see 2."
+
+
+def test_truncate_sentences():
+    assert truncate_sentences("One. Two. Three.", 2) == "One. Two."
+    assert truncate_sentences("Only one sentence.", 3) == "Only one sentence."
+    assert truncate_sentences("No terminator", 1) == "No terminator"
+
+
+def test_max_sentences_must_be_positive():
+    with pytest.raises(ValueError):
+        DecodeControls(ByteTokenizer(), max_sentences=0)
+    with pytest.raises(ValueError):
+        truncate_sentences("One. Two.", 0)
+
+
+def test_deadline_stops_all_rows():
+    controls = DecodeControls(ByteTokenizer(), deadline=time.monotonic() - 1)
+    assert controls.step([65, 66]) == [True, True]
+    assert controls.stop_reason == "deadline"
+
+
+def test_prepare_decode_controls_merges_caller_criteria():
+    pytest.importorskip("transformers")
+    caller = [object()]
+    max_new_tokens, gen_kwargs, controls = prepare_decode_controls(
+        ByteTokenizer(), 256, {"stopping_criteria": caller, "do_sample": False},
+        max_sentences=1, target_speech_s=4,
+    )
+    assert max_new_tokens == speech_token_budget(4)
+    assert gen_kwargs["do_sample"] is False
+    assert gen_kwargs["stopping_criteria"][0] is caller[0]
+    assert len(gen_kwargs["stopping_criteria"]) == 2
+    assert controls is not None and controls.max_sentences == 1
+
+    _, gen_kwargs, controls = prepare_decode_controls(ByteTokenizer(), 64, {})
+    assert controls is None and "stopping_criteria" not in gen_kwargs
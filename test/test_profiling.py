@@ -0,0 +1,95 @@
+import json
+import threading
+
+import pytest
+
+import profiling
+
+# Checks for the per-request profiler (no model or server needed)
+# python -m pytest -q test/test_profiling.py
+
+
+@pytest.fixture(autouse=True)
+def no_active_profile():
+    profiling._LOCAL.profile = None
+    yield
+    profiling._LOCAL.profile = None
+
+
+@pytest.mark.parametrize("value", ["1", "true", "YES", " on "])
+def test_should_profile_header_opt_in(value):
+    assert profiling.should_profile(value)
+
+
+@pytest.mark.parametrize("value", [None, "", "0", "false", "off", "no"])
+def test_should_profile_header_off(value):
+    assert not profiling.should_profile(value)
+
+
+def test_should_profile_sample_rate(monkeypatch):
+    monkeypatch.setattr(profiling.random, "random", lambda: 0.3)
+    assert profiling.should_profile(None, sample_rate=0.5)
+    assert not profiling.should_profile(None, sample_rate=0.2)
+    assert not profiling.should_profile(None, sample_rate=0.0)
+
+
+def test_hooks_are_noops_when_off():
+    assert profiling.current() is None
+    assert profiling.stage("x") is profiling._NULL_STAGE
+    with profiling.stage("x"):
+        pass
+
+
+def test_end_writes_artifacts_and_is_idempotent(tmp_path):
+    profile = profiling.begin("req", interval_s=0.001)
+    assert profiling.current() is profile
+    with profiling.stage("asr"):
+        pass
+    profile.record_decode_step(2.0)
+
+    artifacts = profiling.end(profile, str(tmp_path))
+    assert set(artifacts) == {"collapsed", "summary"}
+    assert profiling.current() is None
+    summary = json.loads((tmp_path / artifacts["summary"]).read_text())
+    assert "asr" in summary["stage_totals_ms"]
+    assert summary["decode"]["tokens"] == 1
+    assert (tmp_path / artifacts["collapsed"]).exists()
+
+    assert profiling.end(profile, str(tmp_path)) is artifacts
+
+
+def test_end_does_not_retry_failed_write(tmp_path):
+    blocker = tmp_path / "file"
+    blocker.write_text("")
+    profile = profiling.begin("req")
+    with pytest.raises(OSError):
+        profiling.end(profile, str(blocker / "profiles"))
+    assert profiling.current() is None
+    assert profiling.end(profile, str(tmp_path)) == {}
+    assert list(tmp_path.iterdir()) == [blocker]
+
+
+def test_profile_does_not_leak_across_requests_on_a_reused_thread(tmp_path):
+    seen = []
+
+    def worker():
+        profile = profiling.begin("first")
+        profiling.end(profile, str(tmp_path))
+        # Next request handled by the same thread without profiling
+        seen.append(profiling.current())
+        seen.append(profiling.stage("x") is profiling._NULL_STAGE)
+
+    t = threading.Thread(target=worker)
+    t.start()
+    t.join()
+    assert seen == [None, True]
+
+
+def test_profile_is_local_to_its_thread(tmp_path):
+    profile = profiling.begin("req")
+    seen = []
+    t = threading.Thread(target=lambda: seen.append(profiling.current()))
+    t.start()
+    t.join()
+    profiling.end(profile, str(tmp_path))
+    assert seen == [None]